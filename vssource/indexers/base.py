@@ -2,12 +2,17 @@ from __future__ import annotations
 
 import os
 import shutil
+import struct
 import subprocess
 import tempfile
 from abc import ABC, abstractmethod
-from hashlib import md5
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from hashlib import blake2b
 from os import name as os_name
-from typing import TYPE_CHECKING, Any, Callable, ClassVar, Iterable, Literal, Protocol, Sequence
+from stat import S_ISREG
+from typing import TYPE_CHECKING, Any, Callable, ClassVar, Literal, Protocol, Sequence, TypeVar
 
 from vstools import (
     MISSING, ChromaLocationT, ColorRangeT, CustomRuntimeError, DataType, FieldBasedT, MatrixT, MissingT, PrimariesT,
@@ -28,6 +33,37 @@ __all__ = [
 ]
 
 
+_T = TypeVar('_T')
+_R = TypeVar('_R')
+
+_VideoFilesKey = tuple[tuple[str, int, int], ...]
+
+_BIN_PATH_CACHE = dict[str, SPath]()
+
+
+@lru_cache(maxsize=128)
+def _get_videos_hash(files_key: _VideoFilesKey) -> str:
+    hasher = blake2b(digest_size=8)
+
+    # mtime is signed, files from before 1970 have a negative one
+    hasher.update(struct.pack(
+        f'<Q{"Qq" * len(files_key)}', len(files_key), *(x for _, size, mtime in files_key for x in (size, mtime))
+    ))
+
+    for path, _, _ in files_key:
+        hasher.update(os.path.basename(path).encode())
+        hasher.update(b'\0')
+
+    return hasher.hexdigest()
+
+
+def _try_stat(path: SPath) -> os.stat_result | None:
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
 class VSSourceFunc(Protocol):
     def __call__(self, path: DataType, *args: Any, **kwargs: Any) -> vs.VideoNode:
         ...
@@ -55,10 +91,15 @@ class Indexer(ABC):
         return '_'.join([file.name for file in files])
 
     @classmethod
-    def get_videos_hash(cls, files: list[SPath]) -> str:
-        lenght = sum(file.stat().st_size for file in files)
-        to_hash = lenght.to_bytes(32, 'little') + cls.get_joined_names(files).encode()
-        return md5(to_hash).hexdigest()
+    def get_videos_hash(cls, files: list[SPath], stats: Sequence[os.stat_result] | None = None) -> str:
+        return _get_videos_hash(cls._get_files_key(files, stats))
+
+    @staticmethod
+    def _get_files_key(files: list[SPath], stats: Sequence[os.stat_result] | None = None) -> _VideoFilesKey:
+        if stats is None:
+            stats = [os.stat(file) for file in files]
+
+        return tuple((file.to_str(), st.st_size, st.st_mtime_ns) for file, st in zip(files, stats))
 
     @classmethod
     def source_func(cls, path: DataType | SPathLike, *args: Any, **kwargs: Any) -> vs.VideoNode:
@@ -72,12 +113,12 @@ class Indexer(ABC):
             if str(f).startswith('file:///'):
                 f = str(f)[8::]  # type: ignore
 
-            files.append(SPath(f))
+            files.append((f if isinstance(f, SPath) else SPath(f)).absolute())
 
         return files
 
     def _source(
-        self, clips: Iterable[vs.VideoNode],
+        self, clips: Sequence[vs.VideoNode],
         bits: int | None = None,
         matrix: MatrixT | None = None,
         transfer: TransferT | None = None,
@@ -86,13 +127,12 @@ class Indexer(ABC):
         color_range: ColorRangeT | None = None,
         field_based: FieldBasedT | None = None
     ) -> vs.VideoNode:
-        clips = list(clips)
-
         if len(clips) == 1:
             clip = clips[0]
         else:
             clip = core.std.Splice(clips)
 
+        # Not skipped when every argument is None, the missing frame props still get guessed and set
         return initialize_clip(
             clip, bits, matrix, transfer, primaries, chroma_location, color_range, field_based
         )
@@ -110,7 +150,7 @@ class Indexer(ABC):
         **kwargs: Any
     ) -> vs.VideoNode:
         return self._source(
-            [self.source_func(f.to_str(), **kwargs) for f in self.normalize_filenames(file)],
+            [self.source_func(f, **kwargs) for f in self.normalize_filenames(file)],
             bits, matrix, transfer, primaries, chroma_location, color_range, field_based
         )
 
@@ -121,6 +161,12 @@ class ExternalIndexer(Indexer):
 
     _default_args: ClassVar[tuple[str, ...]] = ()
 
+    parallel_threshold: ClassVar[int] = 4
+    """
+    Minimum number of independent indexing jobs before they get run in parallel.
+    On the first failure the jobs that haven't started yet are cancelled.
+    """
+
     def __init__(
         self, *, bin_path: SPathLike | MissingT = MISSING, ext: str | MissingT = MISSING,
         force: bool = True, default_out_folder: SPathLike | Literal[False] | None = None,
@@ -138,6 +184,8 @@ class ExternalIndexer(Indexer):
         self.ext = ext
         self.default_out_folder = default_out_folder
 
+        self._default_args_str = tuple(map(str, self._default_args))
+
     @abstractmethod
     def get_cmd(self, files: list[SPath], output: SPath) -> list[str]:
         """Returns the indexer command"""
@@ -153,36 +201,56 @@ class ExternalIndexer(Indexer):
         raise NotImplementedError
 
     def _get_bin_path(self) -> SPath:
-        if not (bin_path := shutil.which(str(self.bin_path))):
-            raise FileNotFoundError(f'Indexer: `{self.bin_path}` was not found{" in PATH" if os_name == "nt" else ""}!')
-        return SPath(bin_path)
+        if (bin_name := str(self.bin_path)) not in _BIN_PATH_CACHE:
+            if not (bin_path := shutil.which(bin_name)):
+                raise FileNotFoundError(
+                    f'Indexer: `{self.bin_path}` was not found{" in PATH" if os_name == "nt" else ""}!'
+                )
+            _BIN_PATH_CACHE[bin_name] = SPath(bin_path)
+        return _BIN_PATH_CACHE[bin_name]
 
     def _run_index(self, files: list[SPath], output: SPath, cmd_args: Sequence[str]) -> None:
         output.mkdirp()
 
-        proc = subprocess.Popen(
-            list(map(str, (*self.get_cmd(files, output), *cmd_args, *self._default_args))),
-            text=True, encoding='utf-8', shell=os_name == 'nt', cwd=output.get_folder().to_str()
-        )
+        # The output is captured in files rather than pipes so the indexer
+        # can never stall on a full pipe buffer while we wait for it to exit
+        with tempfile.TemporaryFile() as stdout_file, tempfile.TemporaryFile() as stderr_file:
+            proc = subprocess.Popen(
+                [*map(str, (*self.get_cmd(files, output), *cmd_args)), *self._default_args_str],
+                stdout=stdout_file, stderr=stderr_file, cwd=output.get_folder()
+            )
 
-        status = proc.wait()
+            status = proc.wait()
 
-        if status:
-            stderr = stdout = ''
+            if status:
+                stderr_file.seek(0)
+                stdout_file.seek(0)
 
-            if proc.stderr:
-                stderr = proc.stderr.read().strip()
+                stderr = stderr_file.read().decode('utf-8', errors='replace').strip()
                 if stderr:
                     stderr = f'\n\t{stderr}'
 
-            if proc.stdout:
-                stdout = proc.stdout.read().strip()
+                stdout = stdout_file.read().decode('utf-8', errors='replace').strip()
                 if stdout:
                     stdout = f'\n\t{stdout}'
 
-            raise CustomRuntimeError(
-                f"There was an error while running the {self.bin_path} command!: {stderr}{stdout}"
-            )
+                raise CustomRuntimeError(
+                    f"There was an error while running the {self.bin_path} command!: {stderr}{stdout}"
+                )
+
+    def _map_jobs(self, func: Callable[[_T], _R], jobs: Sequence[_T]) -> list[_R]:
+        if len(jobs) < self.parallel_threshold:
+            return list(map(func, jobs))
+
+        with ThreadPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 4)) as executor:
+            futures = [executor.submit(func, job) for job in jobs]
+
+            try:
+                return [future.result() for future in futures]
+            except BaseException:
+                # Don't start the queued indexers once one failed, the running ones still get waited on
+                executor.shutdown(cancel_futures=True)
+                raise
 
     def get_out_folder(
         self, output_folder: SPathLike | Literal[False] | None = None, file: SPath | None = None
@@ -213,26 +281,31 @@ class ExternalIndexer(Indexer):
     ) -> list[SPath]:
         files = to_arr(files)
 
-        if len(unique_folders := list(set([f.get_folder().to_str() for f in files]))) > 1:
+        folder_groups = defaultdict[str, list[SPath]](list)
+
+        for f in files:
+            folder_groups[f.get_folder().to_str()].append(f)
+
+        if len(folder_groups) > 1:
+            # Folders are indexed one after another, only the per-file jobs of each get parallelized
             return [
-                c for s in (
-                    self.index(
-                        [f for f in files if f.get_folder().to_str() == folder],
-                        force, split_files, output_folder
-                    )
-                    for folder in unique_folders
-                ) for c in s
+                c for group in folder_groups.values()
+                for c in self.index(group, force, split_files, output_folder, *cmd_args)
             ]
 
         dest_folder = self.get_out_folder(output_folder, files[0])
 
-        files = list(sorted(set(files)))
+        files = sorted(dict.fromkeys(files))
+
+        stats = [os.stat(file) for file in files]
 
-        hash_str = self.get_videos_hash(files)
+        files_key = self._get_files_key(files, stats)
+
+        hash_str = _get_videos_hash(files_key)
 
         def _index(files: list[SPath], output: SPath) -> None:
-            if output.is_file():
-                if output.stat().st_size == 0 or force:
+            if (out_stat := _try_stat(output)) is not None and S_ISREG(out_stat.st_mode):
+                if out_stat.st_size == 0 or force:
                     output.unlink()
                 else:
                     return self.update_video_filenames(output, files)
@@ -241,12 +314,11 @@ class ExternalIndexer(Indexer):
         if not split_files:
             output = self.get_video_idx_path(dest_folder, hash_str, 'JOINED' if len(files) > 1 else 'SINGLE')
             _index(files, output)
-            return [output]
-
-        outputs = [self.get_video_idx_path(dest_folder, hash_str, file.name) for file in files]
+            outputs = [output]
+        else:
+            outputs = [self.get_video_idx_path(dest_folder, hash_str, file.name) for file in files]
 
-        for file, output in zip(files, outputs):
-            _index([file], output)
+            self._map_jobs(lambda job: _index([job[0]], job[1]), list(zip(files, outputs)))
 
         return outputs
 
@@ -272,7 +344,7 @@ class ExternalIndexer(Indexer):
         index_files = self.index(self.normalize_filenames(file))
 
         return self._source(
-            (self.source_func(idx_filename.to_str(), **kwargs) for idx_filename in index_files),
+            [self.source_func(idx_filename, **kwargs) for idx_filename in index_files],
             bits, matrix, transfer, primaries, chroma_location, color_range, field_based
         )
 